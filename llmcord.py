@@ -1,30 +1,73 @@
 import asyncio
-import base64
+import binascii
+from collections import deque, OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime as dt
+import hashlib
+from itertools import groupby
+import json
 import logging
-import requests
+from logging.handlers import QueueHandler, QueueListener
+import queue
 import sys
+import time
 import re
 from typing import Optional, List, Dict, Any, AsyncGenerator
 from bs4 import BeautifulSoup
 
-import discord
-from openai import AsyncOpenAI
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-print("Starting llmcord.py")
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
-# Configure logging to output to both console and file
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s",
-    handlers=[
-        logging.FileHandler("llmcord.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+import aiohttp
+import discord
+from openai import AsyncOpenAI
 
-logging.info("Logging initialized")
+# Configure logging to output to both console and file; records pass through a queue
+# so disk/console I/O happens on a background thread, off the event loop
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_formatter = logging.Formatter("%(asctime)s %(levelname)s: %(message)s")
+_log_handlers = [logging.FileHandler("llmcord.log"), logging.StreamHandler(sys.stdout)]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
+
+logger = logging.getLogger(__name__)
+
+logger.info("Logging initialized")
+
+METADATA_TEMPLATE = "<metadata>\n<author_nick>{nick}</author_nick>\n<author_name>{name}</author_name>\n<author_id>{tag}</author_id>\n<datetime>{datetime}</datetime>\n</metadata>\n\n\n\n"
+
+METADATA_RE = re.compile(r'<\s*metadata\b')
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+')
+
+# Exact capability table for common model names (keyed without the provider prefix);
+# anything not listed falls back to the substring markers on LLMCordBot
+MODEL_CAPS = {
+    'gpt-4-turbo': {'images': True},
+    'gpt-4o': {'images': True},
+    'gpt-4o-mini': {'images': True},
+    'claude-3-opus': {'images': True},
+    'claude-3-sonnet': {'images': True},
+    'claude-3-haiku': {'images': True},
+    'gemini-pro-vision': {'images': True},
+    'llava': {'images': True},
+}
+
+def _completed_event() -> asyncio.Event:
+    event = asyncio.Event()
+    event.set()
+    return event
 
 @dataclass
 class MsgNode:
@@ -34,19 +77,37 @@ class MsgNode:
     too_many_images: bool = False
     has_bad_attachments: bool = False
     fetch_next_failed: bool = False
-    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Set while no response is in flight for this node; cleared during streaming so the
+    # pruner waits instead of deleting a node that is still being written
+    done: asyncio.Event = field(default_factory=_completed_event)
+
+@dataclass
+class _StreamState:
+    # Per-response streaming bookkeeping; lives on the stack, not the bot instance,
+    # because several responses can be streaming concurrently
+    tag_tail: str = ""
+    last_flushed: str = ""
+    chars_since_edit: int = 0
+    last_task_time: float = 0.0
 
 class APIClient:
-    def __init__(self, config: Dict[str, Any]):
-        logging.info("Initializing APIClient")
+    def __init__(self, config: Dict[str, Any], shared_clients: Optional[Dict[tuple, AsyncOpenAI]] = None):
+        logger.info("Initializing APIClient")
         provider, self.model_name = config['model'].split("/", 1)
         self.base_url = config['providers'][provider]['base_url']
         self.api_key = config['providers'][provider].get('api_key', 'None')
-        self.openai_client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
-        logging.info(f"APIClient initialized with model: {self.model_name}")
+        if shared_clients is not None:
+            # Bots pointed at the same provider reuse one client (and its connection pool)
+            client_key = (self.base_url, self.api_key)
+            if client_key not in shared_clients:
+                shared_clients[client_key] = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+            self.openai_client = shared_clients[client_key]
+        else:
+            self.openai_client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+        logger.info("APIClient initialized with model: %s", self.model_name)
 
     async def generate_response(self, messages: List[Dict[str, Any]], **kwargs) -> AsyncGenerator[Any, None]:
-        logging.info("Generating response")
+        logger.debug("Generating response")
         return await self.openai_client.chat.completions.create(
             model=self.model_name,
             messages=messages,
@@ -55,21 +116,43 @@ class APIClient:
         )
 
 class LLMCordBot:
-    def __init__(self, config: Dict[str, Any]):
-        logging.info("Initializing LLMCordBot")
+    IMAGE_EXTS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'webp'})
+    TEXT_EXTS = frozenset({'txt', 'md', 'c', 'cpp', 'py', 'json'})
+
+    ALLOWED_FILE_TYPES = ("image", "text")
+    ALLOWED_CHANNEL_TYPES = (discord.ChannelType.text, discord.ChannelType.public_thread, discord.ChannelType.private_thread, discord.ChannelType.private)
+    VISION_MODEL_MARKERS = ("gpt-4-turbo", "gpt-4o", "claude-3", "gemini", "llava", "vision")
+
+    TRIVIAL_REPLIES = {
+        'hi': 'Hey!',
+        'hello': 'Hey!',
+        'hey': 'Hey!',
+        'thanks': "You're welcome!",
+        'thank you': "You're welcome!",
+        'ty': "You're welcome!",
+        'lol': '😄',
+        'ok': '👍',
+    }
+
+    def __init__(self, config: Dict[str, Any], shared_clients: Optional[Dict[tuple, AsyncOpenAI]] = None):
+        logger.info("Initializing LLMCordBot")
         self.config = config
-        self.msg_nodes: Dict[int, MsgNode] = {}
-        self.last_task_time: Optional[float] = None
-        self.api_client = APIClient(config)
-        self.context = ""
-
-        self.LLM_ACCEPTS_IMAGES = any(x in self.config['model'] for x in ("gpt-4-turbo", "gpt-4o", "claude-3", "gemini", "llava", "vision"))
+        self.msg_nodes: OrderedDict[int, MsgNode] = OrderedDict()
+        self.api_client = APIClient(config, shared_clients)
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.channel_cache: Dict[int, deque] = {}
+
+        model = self.config['model']
+        model_name = model.partition('/')[2] or model
+        caps = MODEL_CAPS.get(model_name)
+        if caps is not None:
+            self.LLM_ACCEPTS_IMAGES = caps['images']
+        else:
+            self.LLM_ACCEPTS_IMAGES = any(x in model for x in self.VISION_MODEL_MARKERS)
         self.LLM_ACCEPTS_NAMES = "openai/" in self.config['model']
 
-        self.ALLOWED_FILE_TYPES = ("image", "text")
-        self.ALLOWED_CHANNEL_TYPES = (discord.ChannelType.text, discord.ChannelType.public_thread, discord.ChannelType.private_thread, discord.ChannelType.private)
-        self.ALLOWED_CHANNEL_IDS = self.config.get('allowed_channel_ids', [])
-        self.ALLOWED_ROLE_IDS = self.config.get('allowed_role_ids', [])
+        self.ALLOWED_CHANNEL_IDS = frozenset(self.config.get('allowed_channel_ids', []))
+        self.ALLOWED_ROLE_IDS = frozenset(self.config.get('allowed_role_ids', []))
 
         self.MAX_TEXT = self.config.get('max_text', 10000)
         self.MAX_IMAGES = self.config.get('max_images', 5) if self.LLM_ACCEPTS_IMAGES else 0
@@ -81,12 +164,43 @@ class LLMCordBot:
         self.EMBED_COLOR_INCOMPLETE = discord.Color.orange()
         self.STREAMING_INDICATOR = " ⚪"
         self.EDIT_DELAY_SECONDS = 1
+        self.EDIT_CHAR_THRESHOLD = 80
+        # Templates for the hot streaming path; per-flush embeds are copies of these
+        self._embed_incomplete = discord.Embed(color=self.EMBED_COLOR_INCOMPLETE)
+        self._embed_complete = discord.Embed(color=self.EMBED_COLOR_COMPLETE)
         self.MAX_MESSAGE_LENGTH = 2000 if self.USE_PLAIN_RESPONSES else (4096 - len(self.STREAMING_INDICATOR))
         self.MAX_MESSAGE_NODES = 200
 
         self.user_cooldowns: Dict[int, float] = {}
         self.COOLDOWN_SECONDS = 10
 
+        self._pending_handlers: Dict[tuple, asyncio.Task] = {}
+        self.DEBOUNCE_SECONDS = 0.1
+
+        self._system_prompt_minute = ""
+        self._system_prompt_cached: Dict[str, str] = {}
+        # Static part of the system prompt; only the timestamp suffix changes per minute
+        self._system_prompt_prefix = self.config.get('system_prompt', '')
+
+        self._last_error_log = 0.0
+
+        self._trivial_re = re.compile(r'^(hi|hello|hey|thanks|thank you|ty|lol|ok)[!.? ]*$', re.IGNORECASE)
+        self._mention_re = re.compile(r'<@!?\d+>')
+        self.llm_skipped = 0
+
+        self.response_cache: Dict[str, tuple] = {}  # prompt hash -> (monotonic time, full response text)
+        self.RESPONSE_CACHE_MAX = 512
+        self.RESPONSE_CACHE_TTL_SECONDS = 3600
+
+        self.url_cache: Dict[str, tuple] = {}  # url -> (monotonic time, extracted text)
+        self.URL_CACHE_MAX = 512
+        self.URL_CACHE_TTL_SECONDS = 600
+
+        self.name_cache: Dict[tuple, tuple] = {}  # (guild id, user id) -> (monotonic time, display name)
+        self.NAME_CACHE_MAX = 1024
+        self.NAME_CACHE_TTL_SECONDS = 60
+        self.MAX_URL_BYTES = 2 << 20  # stop downloading a page beyond 2 MiB
+
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
@@ -97,243 +211,499 @@ class LLMCordBot:
         async def on_message(new_msg: discord.Message):
             await self.handle_message(new_msg)
 
-        logging.info("LLMCordBot initialization complete")
+        logger.info("LLMCordBot initialization complete")
 
     def get_system_prompt(self) -> Dict[str, str]:
-        system_prompt_extras = [
-            f"The current UTC date and time are {dt.now().strftime('%Y-%m-%d %H:%M:%S')}."
-        ]
-        return {
-            "role": "system",
-            "content": "\n".join([self.config.get('system_prompt', '')] + system_prompt_extras),
-        }
+        # The prompt only varies with the clock, so rebuild at most once per minute
+        minute = dt.now().strftime('%Y-%m-%d %H:%M')
+        if minute != self._system_prompt_minute:
+            self._system_prompt_cached = {
+                "role": "system",
+                "content": f"{self._system_prompt_prefix}\nThe current UTC date and time are {minute}.",
+            }
+            self._system_prompt_minute = minute
+        return self._system_prompt_cached
 
     async def handle_message(self, new_msg: discord.Message):
+        # Keep the per-channel cache current for every message we see, including our own responses
+        if new_msg.channel.id in self.channel_cache:
+            self.channel_cache[new_msg.channel.id].append(new_msg)
+
         if new_msg.author == self.discord_client.user:
             return
 
-        await asyncio.sleep(0.1)  # Small delay to reduce likelihood of duplicate message handling
+        # Debounce per (channel, author): a newer message supersedes a still-pending one,
+        # so only the last message of a quick burst is handled
+        key = (new_msg.channel.id, new_msg.author.id)
+        pending = self._pending_handlers.pop(key, None)
+        if pending is not None and not pending.done():
+            pending.cancel()
+        self._pending_handlers[key] = asyncio.create_task(self._handle_message_debounced(new_msg, key))
+
+    async def _handle_message_debounced(self, new_msg: discord.Message, key: tuple):
+        await asyncio.sleep(self.DEBOUNCE_SECONDS)
+        self._pending_handlers.pop(key, None)
 
         if not self._is_message_allowed(new_msg):
             return
 
         if self._is_user_on_cooldown(new_msg.author.id):
-            logging.info(f"User {new_msg.author.id} is on cooldown.")
+            logger.debug("User %s is on cooldown.", new_msg.author.id)
             return
 
         self._update_user_cooldown(new_msg.author.id)
 
-        logging.info(f"Message received (user ID: {new_msg.author.id}, attachments: {len(new_msg.attachments)}:\n{new_msg.content}")
-
-        self.context = await self._fetch_channel_history(new_msg.channel)
-        
-        self.images = []
-        await self._handle_attachments(new_msg)
+        # Greetings/acks don't need history, attachments, or an LLM round-trip
+        if not new_msg.attachments:
+            match = self._trivial_re.match(self._mention_re.sub('', new_msg.content).strip())
+            if match:
+                self.llm_skipped += 1
+                logger.info("Trivial message from user %s; replying without LLM call", new_msg.author.id)
+                await new_msg.channel.send(content=self.TRIVIAL_REPLIES[match.group(1).lower()])
+                return
+
+        logger.info("Message received (user ID: %s, attachments: %d):\n%s", new_msg.author.id, len(new_msg.attachments), new_msg.content)
+
+        # The channel history fetch and the attachment/URL downloads are independent network
+        # work, so run them concurrently
+        history, (extra_context_parts, images) = await asyncio.gather(
+            self._fetch_channel_history(new_msg.channel),
+            self._handle_attachments(new_msg),
+        )
+        context = "".join([history] + extra_context_parts)
 
-        await self._generate_and_send_response(new_msg, self.context)
+        await self._generate_and_send_response(new_msg, context, images)
 
     def _is_message_allowed(self, msg: discord.Message) -> bool:
+        parent_id = getattr(msg.channel, "parent_id", None)
         allowed = (
             msg.channel.type in self.ALLOWED_CHANNEL_TYPES
-            and (msg.channel.type == discord.ChannelType.private or self.discord_client.user.id in [user.id for user in msg.mentions])
-            and (not self.ALLOWED_CHANNEL_IDS or any(id in self.ALLOWED_CHANNEL_IDS for id in (msg.channel.id, getattr(msg.channel, "parent_id", None))))
-            and (not self.ALLOWED_ROLE_IDS or (msg.channel.type != discord.ChannelType.private and any(role.id in self.ALLOWED_ROLE_IDS for role in msg.author.roles)))
+            and (not self.ALLOWED_CHANNEL_IDS or not self.ALLOWED_CHANNEL_IDS.isdisjoint((msg.channel.id, parent_id)))
+            and (msg.channel.type == discord.ChannelType.private or self.discord_client.user in msg.mentions)
+            and (not self.ALLOWED_ROLE_IDS or (msg.channel.type != discord.ChannelType.private and not self.ALLOWED_ROLE_IDS.isdisjoint(role.id for role in msg.author.roles)))
         )
         if not allowed:
             # TODO: fix logspam
-            # logging.info(f"Message not allowed: channel_type={msg.channel.type}, mentioned={self.discord_client.user.id in [user.id for user in msg.mentions]}, channel_id={msg.channel.id}")
+            # logger.info(f"Message not allowed: channel_type={msg.channel.type}, mentioned={self.discord_client.user.id in [user.id for user in msg.mentions]}, channel_id={msg.channel.id}")
             pass
         return allowed
 
     def _is_user_on_cooldown(self, user_id: int) -> bool:
         last_ping_time = self.user_cooldowns.get(user_id)
-        return last_ping_time and (dt.now().timestamp() - last_ping_time) < self.COOLDOWN_SECONDS
+        return last_ping_time and (time.monotonic() - last_ping_time) < self.COOLDOWN_SECONDS
 
     def _update_user_cooldown(self, user_id: int):
-        self.user_cooldowns[user_id] = dt.now().timestamp()
+        now = time.monotonic()
+        if len(self.user_cooldowns) > 1000:
+            # Expired entries are useless after COOLDOWN_SECONDS; sweep them out
+            # opportunistically so the dict doesn't grow with every user ever seen
+            self.user_cooldowns = {
+                uid: ts for uid, ts in self.user_cooldowns.items()
+                if now - ts < self.COOLDOWN_SECONDS
+            }
+        self.user_cooldowns[user_id] = now
 
     async def _fetch_channel_history(self, channel: discord.abc.Messageable) -> str:
         channel_name = getattr(channel, 'name', 'Direct Message')
-        logging.info(f"Fetching channel history for channel: {channel_name}")
-        channel_history = []
-        async for message in channel.history(limit=self.MAX_MESSAGES):
-            channel_history.append(message)
-
-        grouped_messages = []
-        current_group = []
-        last_author_id = None
-
-        for message in reversed(channel_history):
-            if message.author.id != last_author_id:
-                if current_group:
-                    grouped_messages.append(current_group)
-                current_group = []
-            current_group.append(message)
-            last_author_id = message.author.id
-
-        if current_group:
-            grouped_messages.append(current_group)
-
-        final_history = []
-        for group in grouped_messages:
-            author_tag = f"<@{group[0].author.id}>"
-            author_name = self._get_author_name(group[0])
-            content = "\n\n".join([message.content for message in group])
-            metadata = f"<metadata>\n<author_nick>{author_name}</author_nick>\n<author_name>{group[0].author.name}</author_name>\n<author_id>{author_tag}</author_id>\n<datetime>{group[-1].created_at.strftime('%Y-%m-%d %H:%M:%S')}</datetime>\n</metadata>\n\n\n\n"
-            final_history.append(f"{content}\n\n{metadata}")
-
-        logging.info(f"Fetched {len(final_history)} grouped messages from channel history")
+        cache = self.channel_cache.get(channel.id)
+        if cache is None:
+            logger.info("Seeding channel history cache for channel: %s", channel_name)
+            newest_first = [message async for message in channel.history(limit=self.MAX_MESSAGES)]
+            cache = deque(reversed(newest_first), maxlen=self.MAX_MESSAGES)
+            self.channel_cache[channel.id] = cache
+
+        final_history: deque = deque()
+        total_len = 0
+
+        # Walk newest to oldest so we can stop formatting once MAX_TEXT is reached;
+        # oldest messages are the ones dropped when the budget runs out
+        for _, group_iter in groupby(reversed(cache), key=lambda message: message.author.id):
+            group = list(group_iter)
+            group.reverse()  # restore chronological order within the group
+            part = self._format_message_group(group)
+            final_history.appendleft(part)
+            total_len += len(part)
+            if total_len >= self.MAX_TEXT:
+                logger.warning("Channel history exceeds max_text (%d); truncating oldest messages", self.MAX_TEXT)
+                break
+
+        logger.debug("Fetched %d grouped messages from channel history", len(final_history))
         return "\n".join(final_history)
 
+    def _format_message_group(self, group: List[discord.Message]) -> str:
+        author_id = group[0].author.id
+        author_name = self._get_author_name(group[0])
+        content = "\n\n".join([message.content for message in group])
+        metadata = METADATA_TEMPLATE.format(
+            nick=author_name,
+            name=group[0].author.name,
+            tag=f"<@{author_id}>",
+            datetime=group[-1].created_at.replace(tzinfo=None).isoformat(sep=' ', timespec='seconds'),
+        )
+        return f"{content}\n\n{metadata}"
+
     def _get_author_name(self, message: discord.Message) -> str:
-        if isinstance(message.channel, (discord.DMChannel, discord.GroupChannel)):
-            return message.author.display_name
-        member = message.guild.get_member(message.author.id)
-        return member.nick if member and member.nick else message.author.name
+        # Names change rarely, so a short TTL keeps repeated history formats cheap
+        # while still picking up nickname edits within a minute
+        cache_key = (message.guild.id if message.guild else 0, message.author.id)
+        cached = self.name_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < self.NAME_CACHE_TTL_SECONDS:
+            return cached[1]
+
+        author = message.author
+        # Guild messages usually arrive with a Member author already, so the nick is a
+        # plain attribute read; only fall back to the member-cache lookup otherwise
+        if isinstance(author, discord.Member):
+            name = author.nick or author.name
+        elif isinstance(message.channel, (discord.DMChannel, discord.GroupChannel)):
+            name = author.display_name
+        else:
+            member = message.guild.get_member(author.id)
+            name = member.nick if member and member.nick else author.name
+
+        if len(self.name_cache) >= self.NAME_CACHE_MAX:
+            self.name_cache.pop(next(iter(self.name_cache)))
+        self.name_cache[cache_key] = (time.monotonic(), name)
+        return name
 
-    async def _handle_attachments(self, msg: discord.Message):
-        logging.info(f"Handling attachments and URLs for message: {msg.id}")
+    async def _handle_attachments(self, msg: discord.Message) -> tuple:
+        logger.debug("Handling attachments and URLs for message: %s", msg.id)
         image_count = 0
-        urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', msg.content)
+        image_attachments = []
+        text_attachments = []
+        context_parts: List[str] = []
+        urls = URL_RE.findall(msg.content)
         for attachment in msg.attachments:
-            file_type = attachment.filename.split('.')[-1].lower()
-            if file_type in ['png', 'jpg', 'jpeg', 'gif', 'webp'] and self.LLM_ACCEPTS_IMAGES:
+            file_type = attachment.filename.rpartition('.')[2].lower()
+            if file_type in self.IMAGE_EXTS and self.LLM_ACCEPTS_IMAGES:
                 image_count += 1
                 if image_count > self.MAX_IMAGES:
-                    logging.warning(f"Too many images attached by user {msg.author.id}")
+                    logger.warning("Too many images attached by user %s", msg.author.id)
                     msg_node = self.msg_nodes.get(msg.id, MsgNode())
                     msg_node.too_many_images = True
                     self.msg_nodes[msg.id] = msg_node
                     break
                 else:
-                    self.images.append(self._create_image_data(attachment))
-                    logging.info(f"Added image attachment: {attachment.filename}")
-            elif file_type in ['txt', 'md', 'c', 'cpp', 'py', 'json']:
-                file_content = await attachment.read()
-                file_content_str = file_content.decode('utf-8')
-                self.context += f"\n<file name=\"{attachment.filename}\">\n```\n{file_content_str}\n```\n</file>\n"
-                logging.info(f"Added text/source file attachment: {attachment.filename}")
+                    image_attachments.append(attachment)
+                    logger.debug("Added image attachment: %s", attachment.filename)
+            elif file_type in self.TEXT_EXTS:
+                text_attachments.append(attachment)
             else:
-                logging.warning(f"Unsupported file type: {attachment.filename}")
-        for url in urls:
-            url_text = await self._extract_text_from_url(url)
+                logger.warning("Unsupported file type: %s", attachment.filename)
+        # Every download is independent network I/O, so run all of them together;
+        # results are assembled in the original attachment/URL order below
+        image_data, file_contents, url_texts = await asyncio.gather(
+            asyncio.gather(*[self._create_image_data(attachment) for attachment in image_attachments]),
+            asyncio.gather(*[attachment.read() for attachment in text_attachments]),
+            asyncio.gather(*[self._extract_text_from_url(url) for url in urls]),
+        )
+        for attachment, file_content in zip(text_attachments, file_contents):
+            context_parts.append(f"\n<file name=\"{attachment.filename}\">\n```\n{file_content.decode('utf-8')}\n```\n</file>\n")
+            logger.debug("Added text/source file attachment: %s", attachment.filename)
+        for url, url_text in zip(urls, url_texts):
             if url_text:
-                self.context += f"\n<webpage>\n<url>{url}</url>\n<text>\n{url_text}\n</text>\n</webpage>"
-                logging.info(f"Added webpage attachment: {url}")
+                context_parts.append(f"\n<webpage>\n<url>{url}</url>\n<text>\n{url_text}\n</text>\n</webpage>")
+                logger.debug("Added webpage attachment: %s", url)
+        return context_parts, image_data
 
     async def _extract_text_from_url(self, url: str) -> str:
+        cached = self.url_cache.get(url)
+        if cached is not None and time.monotonic() - cached[0] < self.URL_CACHE_TTL_SECONDS:
+            logger.debug("URL cache hit: %s", url)
+            return cached[1]
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = soup.get_text()
+            async with self.http_session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                response.raise_for_status()
+                # Stream the body and stop at the byte cap instead of downloading
+                # arbitrarily large pages just to keep the first 2000 words
+                buf = bytearray()
+                async for chunk in response.content.iter_chunked(16384):
+                    buf.extend(chunk)
+                    if len(buf) >= self.MAX_URL_BYTES:
+                        logger.debug("URL content capped at %d bytes: %s", self.MAX_URL_BYTES, url)
+                        break
+                html = buf.decode(response.get_encoding(), errors='replace')
+            # Parsing is CPU-bound; keep it off the event loop
+            text = await asyncio.to_thread(self._parse_html_text, html)
             # Limit to first 2000 words
-            words = text.split()[:2000]
-            logging.debug(' '.join(words))
-            return ' '.join(words)
+            extracted = ' '.join(text.split()[:2000])
+            logger.debug(extracted)
+            if len(self.url_cache) >= self.URL_CACHE_MAX:
+                self.url_cache.pop(next(iter(self.url_cache)))
+            self.url_cache[url] = (time.monotonic(), extracted)
+            return extracted
         except Exception as e:
-            logging.error(f"Failed to extract text from URL {url}: {str(e)}")
+            logger.error("Failed to extract text from URL %s: %s", url, e)
             return ""
 
-    def _create_image_data(self, attachment: discord.Attachment) -> Dict[str, Any]:
+    @staticmethod
+    def _parse_html_text(html: str) -> str:
+        return BeautifulSoup(html, HTML_PARSER).get_text()
+
+    async def _create_image_data(self, attachment: discord.Attachment) -> Dict[str, Any]:
+        async with self.http_session.get(attachment.url) as response:
+            image_bytes = await response.read()
+        if len(image_bytes) > 1 << 20:
+            # Encoding multi-MB images inline would stall the event loop for tens of ms
+            raw = await asyncio.to_thread(binascii.b2a_base64, image_bytes, newline=False)
+        else:
+            raw = binascii.b2a_base64(image_bytes, newline=False)
+        encoded = raw.decode('ascii')
         return {
             "type": "image_url",
-            "image_url": {"url": f"data:{attachment.content_type};base64,{base64.b64encode(requests.get(attachment.url).content).decode('utf-8')}"},
+            "image_url": {"url": f"data:{attachment.content_type};base64,{encoded}"},
         }
 
-    async def _generate_and_send_response(self, new_msg: discord.Message, context: str):
-        logging.info("Generating and sending response")
+    async def _generate_and_send_response(self, new_msg: discord.Message, context: str, images: List[Dict[str, Any]]):
+        logger.debug("Generating and sending response")
         response_msgs = []
-        response_contents = [""]
+        response_contents = [[]]  # one list of streamed deltas per Discord message bucket
+        response_lengths = [0]
         prev_chunk = None
         edit_task = None
+        stream_state = _StreamState()
 
         messages = [self.get_system_prompt()]
         if context:
             context += f"\n<response user=\"{self.discord_client.user.name}\">"
-            logging.debug(context)
+            logger.debug(context)
             messages.append({"role": "user", "content": [{"type": "text", "text": context}]})
-        for image in self.images:
+        for image in images:
             messages[-1]["content"].append(image)
-            logging.debug(f"Image added to content dictionary in messages list")
+            logger.debug("Image added to content dictionary in messages list")
         
+        # An identical question in an identical conversation state within the TTL
+        # replays the cached response instead of paying for another completion
+        cache_key = self._response_cache_key(new_msg, context, images)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < self.RESPONSE_CACHE_TTL_SECONDS:
+            logger.info("Response cache hit; replaying cached response")
+            if self.USE_PLAIN_RESPONSES:
+                await self._send_plain_responses([[cached[1]]], new_msg)
+            else:
+                for chunk in self._iter_response_chunks(cached[1]):
+                    response_msg = await new_msg.channel.send(embed=discord.Embed(description=chunk, color=self.EMBED_COLOR_COMPLETE))
+                    # Replayed content is final at send time, so these nodes are born done
+                    self.msg_nodes[response_msg.id] = MsgNode(next_msg=new_msg)
+            return
+
         kwargs = dict(extra_body=self.config.get("extra_api_parameters", {}))
+        producer = None
+        aborted = False
 
         try:
             async with new_msg.channel.typing():
-                async for curr_chunk in await self.api_client.generate_response(messages, **kwargs):
-                    should_continue = await self._process_response_chunk(curr_chunk, prev_chunk, response_contents, response_msgs, new_msg, edit_task)
+                # A bounded queue decouples provider token receipt from Discord edit pacing:
+                # if edits back up, puts block and backpressure reaches the provider stream
+                chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=32)
+                stream = await self.api_client.generate_response(messages, **kwargs)
+                producer = asyncio.create_task(self._drain_stream(stream, chunk_queue))
+                while True:
+                    curr_chunk = await chunk_queue.get()
+                    if curr_chunk is None:
+                        break
+                    if isinstance(curr_chunk, BaseException):
+                        raise curr_chunk
+                    should_continue, edit_task = await self._process_response_chunk(curr_chunk, prev_chunk, response_contents, response_lengths, response_msgs, new_msg, edit_task, stream_state)
                     if not should_continue:
+                        aborted = True
                         break
                     prev_chunk = curr_chunk
 
             if self.USE_PLAIN_RESPONSES:
-                await self._send_plain_responses(response_contents, new_msg)
+                # Earlier buckets were already sent as they completed during streaming
+                await self._send_plain_responses([response_contents[-1]], new_msg)
             else:
-                # Ensure the final message is sent
-                if response_contents[-1]:
-                    embed = discord.Embed(description=response_contents[-1], color=self.EMBED_COLOR_COMPLETE)
-                    await new_msg.channel.send(embed=embed)
+                # Ensure the final content is visible even if the stream ended without a final flush
+                rendered = "".join(response_contents[-1])
+                if rendered:
+                    embed = self._embed_complete.copy()
+                    embed.description = rendered
+                    if response_msgs and len(response_msgs) == len(response_contents):
+                        if rendered != stream_state.last_flushed:
+                            await response_msgs[-1].edit(embed=embed)
+                    else:
+                        await new_msg.channel.send(embed=embed)
+
+            full_text = "".join(["".join(bucket) for bucket in response_contents])
+            # A stream stopped by the metadata check is deliberately truncated;
+            # caching it would replay the truncation for the next hour
+            if full_text and not aborted:
+                if len(self.response_cache) >= self.RESPONSE_CACHE_MAX:
+                    self.response_cache.pop(next(iter(self.response_cache)))
+                self.response_cache[cache_key] = (time.monotonic(), full_text)
 
         except asyncio.TimeoutError:
             await self._handle_timeout_error(new_msg)
         except Exception as e:
             await self._handle_general_error(new_msg, e)
+        finally:
+            if producer is not None and not producer.done():
+                producer.cancel()
+            # Always runs, so streaming nodes are marked done even on failure and the
+            # pruner can never wait forever
+            await self._update_msg_nodes(response_msgs, response_contents)
+
+    @staticmethod
+    async def _drain_stream(stream, chunk_queue: asyncio.Queue):
+        try:
+            async for chunk in stream:
+                await chunk_queue.put(chunk)
+        except Exception as e:
+            await chunk_queue.put(e)
+        else:
+            await chunk_queue.put(None)
+
+    def _response_cache_key(self, new_msg: discord.Message, context: str, images: List[Dict[str, Any]]) -> str:
+        # The reply is conditioned on the conversation, so the key must be too: a bare
+        # text match would replay answers to follow-ups like "why?" across channels and
+        # users. Keying on channel + context makes hits rare, but only a truly identical
+        # conversation state is ever deduped. The minute-stamped system prompt stays out
+        # of the key so the clock alone doesn't invalidate entries.
+        payload = {
+            "model": self.config['model'],
+            "channel": new_msg.channel.id,
+            "context": context,
+            "text": self._mention_re.sub('', new_msg.content).strip().lower(),
+            "images": [image["image_url"]["url"] for image in images],
+        }
+        if orjson is not None:
+            raw = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        else:
+            raw = json.dumps(payload, sort_keys=True).encode()
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
 
-        await self._update_msg_nodes(response_msgs, response_contents)
-
-    async def _process_response_chunk(self, curr_chunk, prev_chunk, response_contents, response_msgs, new_msg, edit_task):
+    async def _process_response_chunk(self, curr_chunk, prev_chunk, response_contents, response_lengths, response_msgs, new_msg, edit_task, stream_state):
         if prev_chunk:
             prev_content = prev_chunk.choices[0].delta.content or ""
             curr_content = curr_chunk.choices[0].delta.content or ""
 
-            # Accumulate content
-            response_contents[-1] += prev_content
-
-            # Check for metadata or any XML-like tags in the accumulated content
-            if re.search(r'<\s*metadata\b', response_contents[-1]):
-                logging.warning("Detected hallucinated metadata in LLM response. Stopping inference.")
-                return False
-
-            if len(response_contents[-1]) > self.MAX_MESSAGE_LENGTH:
-                response_contents += [""]
-
-                if not self.USE_PLAIN_RESPONSES:
-                    embed = discord.Embed(description=(response_contents[-1] + self.STREAMING_INDICATOR), color=self.EMBED_COLOR_INCOMPLETE)
-                    response_msg = await new_msg.channel.send(embed=embed)
+            if prev_content:
+                # Buffer the delta; the full string is only rendered when a flush is due
+                response_contents[-1].append(prev_content)
+                response_lengths[-1] += len(prev_content)
+                stream_state.chars_since_edit += len(prev_content)
+
+                # Check for metadata tags, keeping a small tail so tags split across chunks are caught;
+                # almost no chunks contain '<', so skip the regex entirely on the common path
+                window = stream_state.tag_tail + prev_content
+                if '<' in window and METADATA_RE.search(window):
+                    logger.warning("Detected hallucinated metadata in LLM response. Stopping inference.")
+                    return False, edit_task
+                stream_state.tag_tail = window[-16:]
+
+            if response_lengths[-1] > self.MAX_MESSAGE_LENGTH:
+                if self.USE_PLAIN_RESPONSES:
+                    # Send the completed portion now instead of waiting for the stream to
+                    # finish, splitting at the last paragraph break in the window
+                    rendered = "".join(response_contents[-1])
+                    split = rendered.rfind("\n\n", 0, self.MAX_MESSAGE_LENGTH)
+                    if split > 0:
+                        to_send, remainder = rendered[:split], rendered[split + 2:]
+                        # The separator is trimmed from the sent message but must stay in
+                        # the bucket bookkeeping, or the cached/node full text loses a
+                        # paragraph break at every split
+                        kept = to_send + "\n\n"
+                    else:
+                        to_send, remainder = rendered[:self.MAX_MESSAGE_LENGTH], rendered[self.MAX_MESSAGE_LENGTH:]
+                        kept = to_send
+                    response_msg = await new_msg.channel.send(content=to_send)
                     self.msg_nodes[response_msg.id] = MsgNode(next_msg=new_msg)
-                    await self.msg_nodes[response_msg.id].lock.acquire()
-                    self.last_task_time = dt.now().timestamp()
+                    response_contents[-1] = [kept]
+                    response_lengths[-1] = len(kept)
+                    response_contents.append([remainder] if remainder else [])
+                    response_lengths.append(len(remainder))
+                else:
+                    response_contents.append([])
+                    response_lengths.append(0)
+                    embed = self._embed_incomplete.copy()
+                    embed.description = self.STREAMING_INDICATOR
+                    response_msg = await new_msg.channel.send(embed=embed)
+                    msg_node = MsgNode(next_msg=new_msg)
+                    msg_node.done.clear()
+                    self.msg_nodes[response_msg.id] = msg_node
+                    stream_state.last_task_time = time.monotonic()
                     response_msgs += [response_msg]
 
             if not self.USE_PLAIN_RESPONSES:
-                is_final_edit = curr_chunk.choices[0].finish_reason is not None or len(response_contents[-1] + curr_content) > self.MAX_MESSAGE_LENGTH
-
-                if is_final_edit or ((not edit_task or edit_task.done()) and dt.now().timestamp() - self.last_task_time >= self.EDIT_DELAY_SECONDS):
-                    while edit_task and not edit_task.done():
-                        await asyncio.sleep(0)
-                    embed.description = response_contents[-1] if is_final_edit else (response_contents[-1] + self.STREAMING_INDICATOR)
-                    embed.color = self.EMBED_COLOR_COMPLETE if is_final_edit else self.EMBED_COLOR_INCOMPLETE
-                    edit_task = asyncio.create_task(response_msgs[-1].edit(embed=embed))
-                    self.last_task_time = dt.now().timestamp()
-
-        return True
+                is_final_edit = curr_chunk.choices[0].finish_reason is not None or response_lengths[-1] + len(curr_content) > self.MAX_MESSAGE_LENGTH
+
+                if is_final_edit or (stream_state.chars_since_edit >= self.EDIT_CHAR_THRESHOLD and time.monotonic() - stream_state.last_task_time >= self.EDIT_DELAY_SECONDS):
+                    rendered = "".join(response_contents[-1])
+                    if is_final_edit or rendered != stream_state.last_flushed:
+                        if edit_task is not None and not edit_task.done():
+                            if is_final_edit:
+                                # The closing edit must land after any in-flight one
+                                await edit_task
+                            else:
+                                # Newer content supersedes the in-flight edit; Discord only needs the latest
+                                edit_task.cancel()
+                        embed = (self._embed_complete if is_final_edit else self._embed_incomplete).copy()
+                        embed.description = rendered if is_final_edit else (rendered + self.STREAMING_INDICATOR)
+                        if not response_msgs:
+                            # First flush of the response: there is no message to edit yet
+                            response_msg = await new_msg.channel.send(embed=embed)
+                            msg_node = MsgNode(next_msg=new_msg)
+                            msg_node.done.clear()
+                            self.msg_nodes[response_msg.id] = msg_node
+                            response_msgs += [response_msg]
+                        else:
+                            edit_task = asyncio.create_task(self._edit_response_msg(response_msgs[-1], embed))
+                        stream_state.last_flushed = rendered
+                        stream_state.chars_since_edit = 0
+                        stream_state.last_task_time = time.monotonic()
+
+        return True, edit_task
+
+    async def _edit_response_msg(self, response_msg: discord.Message, embed: discord.Embed):
+        # discord.py retries most rate limits internally; this guards the ones it
+        # surfaces so a 429 degrades to a delayed edit instead of killing the stream
+        try:
+            await response_msg.edit(embed=embed)
+        except discord.HTTPException as e:
+            if e.status != 429:
+                raise
+            retry_after = getattr(e, 'retry_after', None) or self.EDIT_DELAY_SECONDS * 2
+            logger.warning("Rate limited editing response message; retrying in %.1fs", retry_after)
+            await asyncio.sleep(retry_after)
+            await response_msg.edit(embed=embed)
 
     async def _send_plain_responses(self, response_contents, new_msg):
-        logging.info("Sending plain responses")
-        full_response = "".join(response_contents)
-        split_responses = full_response.split("\n\n")
-        for content in split_responses:
-            while len(content) > self.MAX_MESSAGE_LENGTH:
-                await new_msg.channel.send(content=content[:self.MAX_MESSAGE_LENGTH])
-                content = content[self.MAX_MESSAGE_LENGTH:]
-            if content:
-                response_msg = await new_msg.channel.send(content=content)
-                self.msg_nodes[response_msg.id] = MsgNode(next_msg=new_msg)
-                await self.msg_nodes[response_msg.id].lock.acquire()
+        logger.debug("Sending plain responses")
+        full_response = "".join(["".join(bucket) for bucket in response_contents])
+        contents = list(self._iter_response_chunks(full_response))
+        if not contents:
+            return
+        # Chunks of one response must land in order, and discord.py allows several
+        # in-flight requests per rate-limit bucket, so send them sequentially
+        for content in contents:
+            response_msg = await new_msg.channel.send(content=content)
+            # Content is final at send time, so these nodes are born done
+            self.msg_nodes[response_msg.id] = MsgNode(next_msg=new_msg)
+
+    def _iter_response_chunks(self, text: str):
+        # Single pass over the response: yield windows of at most MAX_MESSAGE_LENGTH,
+        # preferring to break at a paragraph boundary (the separator is dropped, as before)
+        i = 0
+        length = len(text)
+        while i < length:
+            j = min(i + self.MAX_MESSAGE_LENGTH, length)
+            if j < length:
+                split = text.rfind("\n\n", i, j)
+                if split > i:
+                    chunk = text[i:split]
+                    i = split + 2
+                else:
+                    chunk = text[i:j]
+                    i = j
+            else:
+                chunk = text[i:j]
+                i = j
+            if chunk:
+                yield chunk
 
     async def _handle_timeout_error(self, new_msg):
-        logging.error("API request timed out")
+        logger.error("API request timed out")
         error_message = "[ The API request timed out—please try again later ]"
         if not self.USE_PLAIN_RESPONSES:
             embed = discord.Embed(description=error_message, color=discord.Color.red())
@@ -342,7 +712,14 @@ class LLMCordBot:
             await new_msg.channel.send(content=error_message)
 
     async def _handle_general_error(self, new_msg, error):
-        logging.exception("Error while generating response")
+        # Traceback formatting is expensive; rate-limit it so a failing stream can't
+        # saturate the log writer
+        now = time.monotonic()
+        if now - self._last_error_log >= 5:
+            logger.exception("Error while generating response")
+            self._last_error_log = now
+        else:
+            logger.error("Error while generating response: %s", error)
         error_message = f"[ An error occurred while generating the response: {str(error)} ]"
         if not self.USE_PLAIN_RESPONSES:
             embed = discord.Embed(description=error_message, color=discord.Color.red())
@@ -351,9 +728,9 @@ class LLMCordBot:
             await new_msg.channel.send(content=error_message)
 
     async def _update_msg_nodes(self, response_msgs, response_contents):
-        logging.info("Updating message nodes")
+        logger.debug("Updating message nodes")
         data = {
-            "content": "".join(response_contents),
+            "content": "".join(["".join(bucket) for bucket in response_contents]),
             "role": "assistant",
         }
         if self.LLM_ACCEPTS_NAMES:
@@ -361,23 +738,28 @@ class LLMCordBot:
 
         for msg in response_msgs:
             self.msg_nodes[msg.id].data = data
-            self.msg_nodes[msg.id].lock.release()
+            self.msg_nodes[msg.id].done.set()
 
         await self._prune_msg_nodes()
 
     async def _prune_msg_nodes(self):
-        logging.debug("Pruning message nodes")
-        if (num_nodes := len(self.msg_nodes)) > self.MAX_MESSAGE_NODES:
-            for msg_id in sorted(self.msg_nodes.keys())[: num_nodes - self.MAX_MESSAGE_NODES]:
-                async with self.msg_nodes[msg_id].lock:
-                    del self.msg_nodes[msg_id]
+        logger.debug("Pruning message nodes")
+        while len(self.msg_nodes) > self.MAX_MESSAGE_NODES:
+            # Peek the oldest node and wait for its stream to finish before removing it,
+            # so the writer can still find it in msg_nodes while it is being written
+            msg_id = next(iter(self.msg_nodes))
+            await self.msg_nodes[msg_id].done.wait()
+            self.msg_nodes.pop(msg_id, None)
 
     async def start(self):
-        logging.info("Starting LLMCordBot")
+        logger.info("Starting LLMCordBot")
+        self.http_session = aiohttp.ClientSession()
         try:
             await self.discord_client.start(self.config['bot_token'])
         except Exception as e:
-            logging.exception(f"Error starting LLMCordBot: {str(e)}")
+            logger.exception("Error starting LLMCordBot: %s", e)
             raise
+        finally:
+            await self.http_session.close()
 
-logging.info("llmcord.py module loaded")
+logger.info("llmcord.py module loaded")
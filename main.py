@@ -1,16 +1,24 @@
 import asyncio
 import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from llmcord import LLMCordBot
 
 async def main():
-    with open("config.json", "r") as file:
-        configs = json.load(file)
+    with open("config.json", "rb") as file:
+        raw_config = file.read()
+    configs = orjson.loads(raw_config) if orjson else json.loads(raw_config)
 
     tasks = []
+    shared_clients = {}  # (base_url, api_key) -> AsyncOpenAI, reused across bots
     for config in configs:
         # Adjust the config to match the expected structure in LLMCordBot
         adjusted_config = {**config.get('llm_settings', {}), **config.get('discord_settings', {})}
-        bot = LLMCordBot(adjusted_config)
+        bot = LLMCordBot(adjusted_config, shared_clients=shared_clients)
         tasks.append(bot.start())
 
     await asyncio.gather(*tasks)